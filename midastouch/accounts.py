@@ -1,7 +1,11 @@
+import copy
 import hashlib
+import json
 import os
 import re
-from datetime import datetime
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
 from typing import Optional, Self, Union
 
@@ -9,8 +13,113 @@ import pandas as pd
 import yaml
 from anytree import Node, RenderTree
 from platformdirs import user_data_dir
-from sqlalchemy import DateTime, Float, String, and_, create_engine, func, or_
-from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+from sqlalchemy import (
+    DateTime,
+    Float,
+    Index,
+    String,
+    create_engine,
+    event,
+    false,
+    func,
+    literal_column,
+    or_,
+    select,
+    text,
+)
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Mapped,
+    Session,
+    column_property,
+    mapped_column,
+)
+from sqlalchemy.schema import CreateIndex
+
+try:
+    from yaml import CSafeDumper as _YamlDumper
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeDumper as _YamlDumper
+    from yaml import SafeLoader as _YamlLoader
+
+# Number of compiled SQL statements kept per engine. TransactionQuery builds
+# many filter/group/order combinations; the SQLAlchemy default (500) is small
+# enough for them to evict each other.
+_QUERY_CACHE_SIZE = 1200
+
+# Number of rows fetched at a time when building transaction DataFrames.
+_FETCH_BATCH_SIZE = 10_000
+
+# Number of rows sent to the database per INSERT when importing transactions.
+_INSERT_BATCH_SIZE = 10_000
+
+# Version of the stored transactions, kept in the database's PRAGMA user_version.
+# Older databases are migrated when opened:
+# 1: debit descriptions are stored without surrounding (padding) spaces
+# 2: ids are 16-byte BLAKE2b hashes instead of SHA-256 ones
+_DATA_VERSION = 2
+
+# Settings applied to every new SQLite connection. WAL with synchronous=NORMAL
+# only syncs at checkpoints instead of on every commit.
+_SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+)
+
+# Runs of spaces collapsed to one in imported descriptions.
+_MULTISPACE = re.compile(r" {2,}")
+
+
+@lru_cache(maxsize=None)
+def _data_dir() -> Path:
+    """
+    Get the application data folder, creating it the first time.
+
+    Returns
+    -------
+    Path
+        The path to the folder.
+    """
+    return Path(user_data_dir("midastouch", roaming=True, ensure_exists=True))
+
+
+@lru_cache(maxsize=None)
+def _account_dir(subdir: str) -> Path:
+    """
+    Get a folder of the application data folder, creating it the first time.
+
+    Parameters
+    ----------
+    subdir : str
+        The name of the folder.
+
+    Returns
+    -------
+    Path
+        The path to the folder.
+    """
+    account_dir = _data_dir() / subdir
+    account_dir.mkdir(exist_ok=True)
+    return account_dir
+
+
+def _clear_caches():
+    """
+    Forget the data folders and parsed category files cached so far, as if the process had just started.
+    """
+    _data_dir.cache_clear()
+    _account_dir.cache_clear()
+    _YAML_CACHE.clear()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in _SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
 
 
 def generate_hash_id(description, date, deposit, withdrawal, balance):
@@ -35,9 +144,54 @@ def generate_hash_id(description, date, deposit, withdrawal, balance):
     str
         A unique hash identifier for the transaction.
     """
-    date_str = date.strftime("%Y-%m-%d %H:%M:%S")
+    # same output as strftime("%Y-%m-%d %H:%M:%S"), without the strftime cost
+    date_str = date.isoformat(sep=" ", timespec="seconds")
     identifier = f"{description}:{date_str}:{deposit}:{withdrawal}:{balance}"
-    return hashlib.sha256(identifier.encode()).hexdigest()
+    return hashlib.blake2b(identifier.encode(), digest_size=16).hexdigest()
+
+
+def generate_hash_ids(description, date, deposit, withdrawal, balance):
+    """
+    Generate the hash identifiers of many transactions at once.
+
+    Gives the same identifiers as calling generate_hash_id on each transaction.
+
+    Parameters
+    ----------
+    description : pd.Series
+        The descriptions of the transactions.
+    date : pd.Series
+        The dates (and optionally times) of the transactions.
+    deposit : pd.Series
+        The amounts deposited. NaN where the transaction was a withdrawal.
+    withdrawal : pd.Series
+        The amounts withdrawn. NaN where the transaction was a deposit.
+    balance : pd.Series
+        The balances after the transactions.
+
+    Returns
+    -------
+    list[str]
+        The hash identifiers, in the order of the transactions.
+    """
+    # build and encode every identifier with vectorized string operations,
+    # leaving only the hashing itself to the Python loop
+    identifiers = (
+        description.astype(str)
+        + ":"
+        + date.dt.strftime("%Y-%m-%d %H:%M:%S")
+        + ":"
+        + deposit.astype(str)
+        + ":"
+        + withdrawal.astype(str)
+        + ":"
+        + balance.astype(str)
+    ).str.encode("utf-8")
+    blake2b = hashlib.blake2b
+    return [
+        blake2b(identifier, digest_size=16).hexdigest()
+        for identifier in identifiers.tolist()
+    ]
 
 
 class Base(DeclarativeBase):
@@ -62,16 +216,25 @@ class DebitTransaction(Base):
         The amount withdrawn. Use None if the transaction was a deposit.
     balance : float
         The balance after the transaction.
+    signed_amount : float
+        The amount of the transaction, deposit - withdrawal (a missing amount counts as 0). Computed, not stored.
     """
 
     __tablename__ = "debit_transactions"
 
     id: Mapped[str] = mapped_column(String(), primary_key=True, nullable=False)
-    description: Mapped[str] = mapped_column(String(), nullable=False)
-    date: Mapped[datetime] = mapped_column(DateTime(), nullable=False)
+    description: Mapped[str] = mapped_column(String(), nullable=False, index=True)
+    date: Mapped[datetime] = mapped_column(DateTime(), nullable=False, index=True)
     deposit: Mapped[float] = mapped_column(Float(), nullable=True)
     withdrawal: Mapped[float] = mapped_column(Float(), nullable=True)
     balance: Mapped[float] = mapped_column(Float(), nullable=False)
+    # computed by the database; the literal zeros keep the rendered SQL
+    # identical to the expression of the abs_amount index below
+    signed_amount: Mapped[float] = column_property(
+        func.coalesce(deposit, literal_column("0"))
+        - func.coalesce(withdrawal, literal_column("0")),
+        deferred=True,
+    )
 
     def __repr__(self):
         rep = (
@@ -86,6 +249,10 @@ class DebitTransaction(Base):
         return rep
 
 
+# lets ordering and filtering by amount use an index range scan instead of sorting
+Index("ix_debit_transactions_abs_amount", func.abs(DebitTransaction.signed_amount))
+
+
 class CreditTransaction(Base):
     """
     A class to represent a transaction in a credit bank account. Credit accounts don't have deposits or withdrawals. Instead, they have charges and payments.
@@ -104,16 +271,25 @@ class CreditTransaction(Base):
         The amount paid. Use None if the transaction was a charge.
     balance : float
         The balance after the transaction.
+    signed_amount : float
+        The amount of the transaction, charge - payment (a missing amount counts as 0). Computed, not stored.
     """
 
     __tablename__ = "credit_transactions"
 
     id: Mapped[str] = mapped_column(String(), primary_key=True, nullable=False)
-    description: Mapped[str] = mapped_column(String(), nullable=False)
-    date: Mapped[datetime] = mapped_column(DateTime(), nullable=False)
+    description: Mapped[str] = mapped_column(String(), nullable=False, index=True)
+    date: Mapped[datetime] = mapped_column(DateTime(), nullable=False, index=True)
     charge: Mapped[float] = mapped_column(Float(), nullable=True)
     payment: Mapped[float] = mapped_column(Float(), nullable=True)
     balance: Mapped[float] = mapped_column(Float(), nullable=False)
+    # computed by the database; the literal zeros keep the rendered SQL
+    # identical to the expression of the abs_amount index below
+    signed_amount: Mapped[float] = column_property(
+        func.coalesce(charge, literal_column("0"))
+        - func.coalesce(payment, literal_column("0")),
+        deferred=True,
+    )
 
     def __repr__(self):
         rep = (
@@ -128,21 +304,123 @@ class CreditTransaction(Base):
         return rep
 
 
+Index("ix_credit_transactions_abs_amount", func.abs(CreditTransaction.signed_amount))
+
+
+# parsed category files by path, as (mtime_ns, size, categories)
+_YAML_CACHE: dict[str, tuple[int, int, dict]] = {}
+
+
+def _load_categories(path: str) -> dict:
+    """
+    Load the categories stored in a YAML file.
+
+    The parsed file is kept in memory and only read again once its modification time or size changes.
+    It is also mirrored to a JSON file next to it, which is much faster to parse and is read instead
+    of the YAML file as long as it was written from the same content.
+
+    Parameters
+    ----------
+    path : str
+        The path to the YAML file.
+
+    Returns
+    -------
+    dict
+        The categories, as a copy the caller is free to modify.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _YAML_CACHE.get(path)
+    if cached is None or cached[:2] != key:
+        categories = _read_categories(path)
+        cached = _YAML_CACHE[path] = (*key, categories)
+    return copy.deepcopy(cached[2])
+
+
+def _categories_json_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _yaml_digest(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def _read_categories(path: str) -> dict:
+    with open(path, "rb") as yaml_file:
+        content = yaml_file.read()
+    # the sidecar records the digest of the YAML it was written from, so it is
+    # only used for exactly that content, whatever the files' timestamps
+    digest = _yaml_digest(content)
+    try:
+        with open(_categories_json_path(path), "r") as json_file:
+            sidecar = json.load(json_file)
+        if sidecar["yaml_digest"] == digest:
+            return sidecar["categories"]
+    except (OSError, ValueError, LookupError, TypeError):
+        # missing, unreadable or outdated sidecar, rebuilt from the YAML below
+        pass
+    categories = yaml.load(content, Loader=_YamlLoader) or {}
+    _write_categories_json(path, digest, categories)
+    return categories
+
+
+def _write_categories_json(path: str, digest: str, categories: dict):
+    json_path = _categories_json_path(path)
+    try:
+        text = json.dumps({"yaml_digest": digest, "categories": categories})
+        # values JSON can't hold as they are (dates, non-string keys) would
+        # come back different, so such files are only ever read as YAML
+        if json.loads(text)["categories"] != categories:
+            text = None
+    except (TypeError, ValueError):
+        text = None
+    try:
+        if text is None:
+            # drop any sidecar left from an earlier version of the file
+            os.remove(json_path)
+        else:
+            # written through a temporary file so a crash can't leave a
+            # truncated sidecar
+            tmp_path = json_path + ".tmp"
+            with open(tmp_path, "w") as json_file:
+                json_file.write(text)
+            os.replace(tmp_path, json_path)
+    except OSError:
+        pass
+
+
 class CategoryManager:
     def __init__(self):
-        self.directory = user_data_dir("midastouch", roaming=True, ensure_exists=True)
+        self.directory = str(_data_dir())
         self.yaml_file_path = os.path.join(self.directory, "categories.yml")
 
-        if not os.path.exists(self.yaml_file_path):
-            with open(self.yaml_file_path, "w") as yaml_file:
-                yaml.dump({}, yaml_file)
-
-        with open(self.yaml_file_path, "r") as yaml_file:
-            self.categories = yaml.safe_load(yaml_file) or {}
+        # keywords by (name, include_subcategories), cleared on every change
+        self._keywords_cache = {}
+        if os.path.exists(self.yaml_file_path):
+            self.categories = _load_categories(self.yaml_file_path)
+        else:
+            self.categories = {}
+            self.save()
 
     def save(self):
-        with open(self.yaml_file_path, "w") as yaml_file:
-            yaml.dump(self.categories, yaml_file)
+        self._keywords_cache.clear()
+        content = yaml.dump(self.categories, Dumper=_YamlDumper).encode("utf-8")
+        # write to a temporary file first so a crash can't leave a truncated file
+        tmp_path = self.yaml_file_path + ".tmp"
+        with open(tmp_path, "wb") as yaml_file:
+            yaml_file.write(content)
+        os.replace(tmp_path, self.yaml_file_path)
+        _write_categories_json(
+            self.yaml_file_path, _yaml_digest(content), self.categories
+        )
+        # the file now holds exactly these categories, no need to parse it again
+        stat = os.stat(self.yaml_file_path)
+        _YAML_CACHE[self.yaml_file_path] = (
+            stat.st_mtime_ns,
+            stat.st_size,
+            copy.deepcopy(self.categories),
+        )
 
     def _find_category(self, name, category=None, path=""):
         if category is None:
@@ -246,25 +524,83 @@ class CategoryManager:
             print("%s%s" % (pre, node.name))
 
     def _get_keywords_recursive(self, category):
-        keywords = category.get("_keywords", [])
+        # copy, so extending it doesn't modify the category itself
+        keywords = list(category.get("_keywords", []))
         for subcat, subcat_content in category.items():
             if isinstance(subcat_content, dict):
                 keywords.extend(self._get_keywords_recursive(subcat_content))
         return keywords
 
     def get_keywords(self, name, include_subcategories=True):
-        category, path = self._find_category(name)
-        if category and name in category:
-            if include_subcategories:
-                return self._get_keywords_recursive(category[name])
+        key = (name, include_subcategories)
+        if key not in self._keywords_cache:
+            category, path = self._find_category(name)
+            if category and name in category:
+                if include_subcategories:
+                    keywords = self._get_keywords_recursive(category[name])
+                else:
+                    keywords = category[name].get("_keywords", [])
             else:
-                return category[name].get("_keywords", [])
-        else:
-            print(f"Category {name} does not exist.")
-            return []
+                print(f"Category {name} does not exist.")
+                return []
+            self._keywords_cache[key] = tuple(keywords)
+        return list(self._keywords_cache[key])
+
+
+def _ensure_dates(data: pd.DataFrame, file_path) -> pd.DataFrame:
+    """
+    Make sure the dates of transactions read from a CSV file were parsed.
+
+    read_csv leaves the date column as text, without complaining, when some dates don't match the
+    format it expected. They are parsed again here, in whatever format pandas infers.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The transaction data, with a date column.
+    file_path : str
+        The path to the CSV file, for the error message.
+
+    Returns
+    -------
+    pd.DataFrame
+        The transaction data, with dates.
+
+    Raises
+    ------
+    ValueError
+        If some of the dates can't be parsed.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(data["date"]):
+        try:
+            data["date"] = pd.to_datetime(data["date"])
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"Invalid dates in {file_path}: {error}") from error
+    return data
+
+
+class _AccountBase:
+    """
+    Shared implementation of the account types, generic over the ORM model
+    holding the transactions.
+
+    Attributes
+    ----------
+    model_cls : type[Base]
+        The ORM model the account's transactions are stored as.
+    subdir : str
+        The subdirectory of the application data folder holding the database files.
+    amount_cols : tuple[str, str]
+        The names of the amount columns, in order: the one increasing the balance and the one decreasing it.
+    csv_columns : list[str]
+        The names of the columns of the CSV files accepted by add_data, in order.
+    """
 
+    model_cls: type[Base]
+    subdir: str
+    amount_cols: tuple[str, str]
+    csv_columns: list[str]
 
-class DebitAccount:
     def __init__(self, name, create=False):
         """
         An account object that stores transaction data in a SQLite database.
@@ -275,22 +611,40 @@ class DebitAccount:
             The name of the account. Used to create and/or access the database file.
         """
         self.name = name
-        directory = user_data_dir("midastouch", roaming=True, ensure_exists=True)
-        debit_dir = Path(directory) / "debit"
-        debit_dir.mkdir(exist_ok=True)
-        db_path = debit_dir / f"{name}.db"
+        db_path = self._get_account_dir() / f"{name}.db"
         if not db_path.exists() and not create:
             raise FileNotFoundError(
-                f"Debit account '{name}' does not exist. Use create=True to create it."
+                f"{self.subdir.capitalize()} account '{name}' does not exist. Use create=True to create it."
             )
         if create and db_path.exists():
             raise FileExistsError(
-                f"Debit account '{name}' already exists. Use create=False (default) to access it or choose a different name."
+                f"{self.subdir.capitalize()} account '{name}' already exists. Use create=False (default) to access it or choose a different name."
             )
 
-        self.engine = create_engine(f"sqlite:///{db_path}")
+        self.engine = create_engine(
+            f"sqlite:///{db_path}", query_cache_size=_QUERY_CACHE_SIZE
+        )
+        event.listen(self.engine, "connect", _set_sqlite_pragmas)
         Base.metadata.create_all(self.engine)
+        # create_all skips the indexes of tables that already exist, so add the
+        # ones missing from databases created before they were introduced
+        with self.engine.begin() as connection:
+            for index in self.model_cls.__table__.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
         self.session = Session(self.engine)
+        self._migrate()
+
+    @classmethod
+    def _get_account_dir(cls) -> Path:
+        """
+        Get the directory holding the database files of this account type, creating it the first time.
+
+        Returns
+        -------
+        Path
+            The path to the directory.
+        """
+        return _account_dir(cls.subdir)
 
     @classmethod
     def get_all_account_names(cls) -> list[str]:
@@ -302,10 +656,7 @@ class DebitAccount:
         list[str]
             A list of the names of all accounts in the database.
         """
-        directory = user_data_dir("midastouch", roaming=True, ensure_exists=True)
-        debit_dir = Path(directory) / "debit"
-        debit_dir.mkdir(exist_ok=True)
-        db_files = Path(directory).glob("debit/*.db")
+        db_files = cls._get_account_dir().glob("*.db")
         return [file.stem for file in db_files]
 
     @classmethod
@@ -318,10 +669,7 @@ class DebitAccount:
         name : str
             The name of the account to delete.
         """
-        directory = user_data_dir("midastouch", roaming=True, ensure_exists=True)
-        debit_dir = Path(directory) / "debit"
-        debit_dir.mkdir(exist_ok=True)
-        db_path = debit_dir / f"{name}.db"
+        db_path = cls._get_account_dir() / f"{name}.db"
         # Check if account exists
         if not db_path.exists():
             print(f"{name} does not exist")
@@ -334,52 +682,30 @@ class DebitAccount:
             == name
         ):
             os.remove(db_path)
+            # WAL mode files, left behind if a connection wasn't closed cleanly
+            for suffix in ("-wal", "-shm"):
+                Path(f"{db_path}{suffix}").unlink(missing_ok=True)
             print(f"{name} has been deleted")
         else:
             print(f"{name} was not deleted")
 
-    def _add_transaction(
-        self,
-        description: str,
-        date: datetime,
-        deposit: Optional[float],
-        withdrawal: Optional[float],
-        balance: float,
-    ):
+    def _bulk_insert(self, rows: list[dict]):
         """
-        Add a transaction to the database.
+        Add many transactions to the database at once, skipping those already in it.
 
         Parameters
         ----------
-        description : str
-            A description of the transaction.
-        date : datetime
-            The date (and optionally time) of the transaction.
-        deposit : float, optional
-            The amount deposited. Use None if the transaction was a withdrawal.
-        withdrawal : float, optional
-            The amount withdrawn. Use None if the transaction was a deposit.
-        balance : float
-            The balance after the transaction.
+        rows : list[dict]
+            The transactions to add, as dicts mapping the table's column names (id included) to values.
         """
-        id = generate_hash_id(
-            description=description,
-            date=date,
-            deposit=deposit,
-            withdrawal=withdrawal,
-            balance=balance,
-        )
-        if self.session.query(DebitTransaction).filter_by(id=id).first() is not None:
-            return
-        transaction = DebitTransaction(
-            id=id,
-            description=description,
-            date=date,
-            deposit=deposit,
-            withdrawal=withdrawal,
-            balance=balance,
-        )
-        self.session.add(transaction)
+        # the primary key does the duplicate check: OR IGNORE drops rows whose
+        # id is already stored, and the whole import is committed once. The
+        # insert is against the table, so rows skip the ORM bulk insert
+        # machinery, but it still runs in the session's transaction so the
+        # session sees the new rows.
+        stmt = self.model_cls.__table__.insert().prefix_with("OR IGNORE")
+        for start in range(0, len(rows), _INSERT_BATCH_SIZE):
+            self.session.execute(stmt, rows[start : start + _INSERT_BATCH_SIZE])
         self.session.commit()
 
     def add_data(self, file_path):
@@ -389,14 +715,10 @@ class DebitAccount:
         Parameters
         ----------
         file_path : str
-            The path to the CSV file. The file must have columns, in order (no header):
-            - date: datetime
-            - description: str
-            - withdrawal: float
-            - deposit: float
-            - balance: float
+            The path to the CSV file. The file must have the columns listed in the account class docstring, in order (no header).
         """
         data = self._load_csv_data(file_path)
+        data["description"] = self._clean_descriptions(data["description"])
         self._update_db_from_data(data)
 
     def _load_csv_data(self, file_path) -> pd.DataFrame:
@@ -406,50 +728,93 @@ class DebitAccount:
         Parameters
         ----------
         file_path : str
-            The path to the CSV file. The file must have columns, in order (no header):
-            - date: datetime
-            - description: str
-            - withdrawal: float
-            - deposit: float
-            - balance: float
+            The path to the CSV file. The file must have the columns listed in the account class docstring, in order (no header).
 
         Returns
         -------
         pd.DataFrame
             A DataFrame containing transaction data.
         """
-        try:
-            data = pd.read_csv(file_path, header=None)
-            data.columns = ["date", "description", "withdrawal", "deposit", "balance"]
-            data["date"] = pd.to_datetime(data["date"])
-            # replace multiple spaces with single space
-            data["description"] = data["description"].apply(
-                lambda x: re.sub(" +", " ", x)
-            )
-            data["description"] = data["description"].str.ljust(20)
-        except UnicodeDecodeError:
-            data = pd.read_csv(file_path, header=None, encoding="latin1")
-            # keep only columns 2, 3, 5, 7, 8, 13
-            data = data.iloc[:, [2, 3, 5, 7, 8, 13]]
-            data.columns = [
-                "account",
-                "date",
-                "description",
-                "withdrawal",
-                "deposit",
-                "balance",
-            ]
-            # find most common account name and keep only rows with that account name
-            account_name = data["account"].mode()[0]
-            data = data[data["account"] == account_name]
-            data = data.drop(columns=["account"])
-            data["date"] = pd.to_datetime(data["date"])
-        # check if dates are in increasing order
-        if not data["date"].is_monotonic_increasing:
-            # reverse the order of the DataFrame
-            data = data.iloc[::-1]
+        data = pd.read_csv(
+            file_path,
+            header=None,
+            names=self.csv_columns,
+            dtype={
+                "description": "string",
+                **{col: "float64" for col in (*self.amount_cols, "balance")},
+            },
+            parse_dates=["date"],
+            date_format="ISO8601",
+        )
+        return self._sort_by_date(_ensure_dates(data, file_path))
+
+    @staticmethod
+    def _sort_by_date(data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Sort transaction data by date, in place unless the data is in reverse chronological order.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            A DataFrame containing transaction data. Must have a date column.
+
+        Returns
+        -------
+        pd.DataFrame
+            The sorted DataFrame, with a fresh index.
+        """
+        dates = data["date"].to_numpy()
+        if len(dates) > 1 and dates[0] > dates[-1]:
+            # newest-first export: flip it so the sort below has little to do
+            # and same-day transactions end up oldest first too
+            data = data.iloc[::-1].reset_index(drop=True)
+        # stable sort so same-day transactions keep their order from the file
+        # (oldest first, once flipped)
+        data.sort_values("date", kind="mergesort", ignore_index=True, inplace=True)
         return data
 
+    def _migrate(self):
+        """
+        Bring transactions stored by an older version up to date with _DATA_VERSION.
+
+        Transactions are cleaned up the way add_data would now store them and given the ids they
+        would now get, so importing the same files again still skips them.
+        """
+        version = self.session.execute(text("PRAGMA user_version")).scalar_one()
+        if version >= _DATA_VERSION:
+            return
+        table = self.model_cls.__table__
+        # rowid order, so transactions on the same date keep their order
+        result = self.session.execute(
+            select(table).order_by(literal_column("rowid"))
+        ).all()
+        data = pd.DataFrame(result, columns=[column.key for column in table.columns])
+        for col in (*self.amount_cols, "balance"):
+            data[col] = data[col].astype("float64")
+        data["date"] = pd.to_datetime(data["date"])
+        if version < 1:
+            data["description"] = self._clean_descriptions(data["description"])
+        self.session.execute(table.delete())
+        self.session.execute(text(f"PRAGMA user_version = {_DATA_VERSION}"))
+        self._update_db_from_data(data)
+
+    @staticmethod
+    def _clean_descriptions(descriptions: pd.Series) -> pd.Series:
+        """
+        Normalize the descriptions of imported transactions.
+
+        Parameters
+        ----------
+        descriptions : pd.Series
+            The descriptions, as read from the file.
+
+        Returns
+        -------
+        pd.Series
+            The descriptions to store.
+        """
+        return descriptions
+
     def _update_db_from_data(self, data: pd.DataFrame):
         """
         Update the database with data from a DataFrame.
@@ -460,18 +825,25 @@ class DebitAccount:
             A DataFrame containing transaction data. Must have columns:
             - description: str
             - date: datetime
-            - deposit: float
-            - withdrawal: float
+            - the two amount columns of the account: float
             - balance: float
         """
-        for _, row in data.iterrows():
-            self._add_transaction(
-                description=row["description"],
-                date=row["date"],
-                deposit=row["deposit"],
-                withdrawal=row["withdrawal"],
-                balance=row["balance"],
-            )
+        increase_col, decrease_col = self.amount_cols
+        ids = generate_hash_ids(
+            description=data["description"],
+            date=data["date"],
+            deposit=data[increase_col],
+            withdrawal=data[decrease_col],
+            balance=data["balance"],
+        )
+        # zip plain Python lists rather than building a Series per row
+        keys = ["id", "description", "date", increase_col, decrease_col, "balance"]
+        columns = [
+            data[col].tolist()
+            for col in ("description", "date", increase_col, decrease_col, "balance")
+        ]
+        rows = [dict(zip(keys, values)) for values in zip(ids, *columns)]
+        self._bulk_insert(rows)
 
     def get_balance(self) -> float:
         """
@@ -482,10 +854,12 @@ class DebitAccount:
         float
             The current balance of the account.
         """
-        first_transaction = self.query().transactions(as_list=True, ascending=False)[0]
-        if first_transaction is None:
+        balance = self.session.execute(
+            select(self.model_cls.balance).order_by(self.model_cls.date.desc()).limit(1)
+        ).scalar()
+        if balance is None:
             raise ValueError("No transactions found")
-        return first_transaction.balance
+        return balance
 
     def check_validity(self):
         """
@@ -496,17 +870,32 @@ class DebitAccount:
         bool
             True if the transactions are valid, False otherwise.
         """
-        queryer = self.query()
-        if queryer.count() == 0:
+        # count and total in a single scan, summed by SQLite
+        count, total_transactions = self.session.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(self.model_cls.signed_amount), 0),
+            )
+        ).one()
+        if count == 0:
             print("This account has no transactions.")
             return True
-        total_transactions = round(queryer.sum(), 2)
-        first_transaction = queryer.transactions(as_list=True, ascending=True)[0]
+        total_transactions = round(total_transactions, 2)
+        increase_col, decrease_col = self.amount_cols
+        increase, decrease, balance = self.session.execute(
+            select(
+                getattr(self.model_cls, increase_col),
+                getattr(self.model_cls, decrease_col),
+                self.model_cls.balance,
+            )
+            .order_by(self.model_cls.date)
+            .limit(1)
+        ).one()
         # first balance is actually the balance AFTER the first transaction, so we need to remove the first transaction amount
-        if first_transaction.deposit is not None:
-            first_balance = first_transaction.balance - first_transaction.deposit
+        if increase is not None:
+            first_balance = balance - increase
         else:
-            first_balance = first_transaction.balance + first_transaction.withdrawal
+            first_balance = balance + decrease
         last_balance = self.get_balance()
 
         diff_balance = round(last_balance - first_balance, 2)
@@ -522,146 +911,31 @@ class DebitAccount:
 
     def query(self):
         """
-        Execute a custom query on the database.
-
-        Parameters
-        ----------
-        query_str : str
-            The query string to execute.
-        """
-
-        return TransactionQuery(self.session, DebitTransaction)
-
-
-class CreditAccount:
-    def __init__(self, name, create=False):
-        """
-        An account object that stores transaction data in a SQLite database.
-
-        Parameters
-        ----------
-        name : str
-            The name of the account. Used to create and/or access the database file.
-        """
-        self.name = name
-        directory = user_data_dir("midastouch", roaming=True, ensure_exists=True)
-        credit_dir = Path(directory) / "credit"
-        credit_dir.mkdir(exist_ok=True)
-        db_path = credit_dir / f"{name}.db"
-        if not db_path.exists() and not create:
-            raise FileNotFoundError(
-                f"Credit account '{name}' does not exist. Use create=True to create it."
-            )
-        if create and db_path.exists():
-            raise FileExistsError(
-                f"Credit account '{name}' already exists. Use create=False (default) to access it or choose a different name."
-            )
-        self.engine = create_engine(f"sqlite:///{db_path}")
-        Base.metadata.create_all(self.engine)
-        self.session = Session(self.engine)
-
-    @classmethod
-    def get_all_account_names(cls) -> list[str]:
-        """
-        Get the names of all accounts in the database.
+        Start a query on the transactions of the account.
 
         Returns
         -------
-        list[str]
-            A list of the names of all accounts in the database.
-        """
-        directory = user_data_dir("midastouch", roaming=True, ensure_exists=True)
-        db_files = Path(directory).glob("*.db")
-        return [file.stem for file in db_files]
-
-    @classmethod
-    def delete_account(cls, name):
+        TransactionQuery
+            A query object whose filters can be chained.
         """
-        Delete an account from the database.
-
-        Parameters
-        ----------
-        name : str
-            The name of the account to delete.
-        """
-        directory = user_data_dir("midastouch", roaming=True, ensure_exists=True)
-        db_path = Path(directory) / f"{name}.db"
-        # Check if account exists
-        if not db_path.exists():
-            print(f"{name} does not exist")
-            return
-        # Ask user to type full name of account to confirm deletion
-        if (
-            input(
-                f"Are you sure you want to delete {name}? Type full account name to confirm: "
-            )
-            == name
-        ):
-            os.remove(db_path)
-            print(f"{name} has been deleted")
-        else:
-            print(f"{name} was not deleted")
 
-    def _add_transaction(
-        self,
-        description: str,
-        date: datetime,
-        charge: Optional[float],
-        payment: Optional[float],
-        balance: float,
-    ):
-        """
-        Add a transaction to the database.
+        return TransactionQuery(self.session, self.model_cls)
 
-        Parameters
-        ----------
-        description : str
-            A description of the transaction.
-        date : datetime
-            The date (and optionally time) of the transaction.
-        charge : float, optional
-            The amount charged. Use None if the transaction was a payment.
-        payment : float, optional
-            The amount paid. Use None if the transaction was a charge.
-        balance : float
-            The balance after the transaction.
-        """
-        id = generate_hash_id(
-            description=description,
-            date=date,
-            deposit=charge,
-            withdrawal=payment,
-            balance=balance,
-        )
-        if self.session.query(CreditTransaction).filter_by(id=id).first() is not None:
-            return
-        transaction = CreditTransaction(
-            id=id,
-            description=description,
-            date=date,
-            charge=charge,
-            payment=payment,
-            balance=balance,
-        )
-        self.session.add(transaction)
-        self.session.commit()
 
-    def add_data(self, file_path):
-        """
-        Add transaction data from a CSV file to the database.
+class DebitAccount(_AccountBase):
+    """
+    A debit bank account. CSV files added with add_data must have columns, in order (no header):
+    - date: datetime
+    - description: str
+    - withdrawal: float
+    - deposit: float
+    - balance: float
+    """
 
-        Parameters
-        ----------
-        file_path : str
-            The path to the CSV file. The file must have columns, in order (no header):
-            - date (and optionally time): str (format: "YYYY-MM-DD HH:MM:SS" or "YYYY-MM-DD")
-            - description: str
-            - charge: float
-            - payment: float
-            - balance: float
-        """
-        data = self._load_csv_data(file_path)
-        self._update_db_from_data(data)
+    model_cls = DebitTransaction
+    subdir = "debit"
+    amount_cols = ("deposit", "withdrawal")
+    csv_columns = ["date", "description", "withdrawal", "deposit", "balance"]
 
     def _load_csv_data(self, file_path) -> pd.DataFrame:
         """
@@ -671,10 +945,10 @@ class CreditAccount:
         ----------
         file_path : str
             The path to the CSV file. The file must have columns, in order (no header):
-            - date (and optionally time): str (format: "YYYY-MM-DD HH:MM:SS" or "YYYY-MM-DD")
+            - date: datetime
             - description: str
-            - charge: float
-            - payment: float
+            - withdrawal: float
+            - deposit: float
             - balance: float
 
         Returns
@@ -682,125 +956,261 @@ class CreditAccount:
         pd.DataFrame
             A DataFrame containing transaction data.
         """
-        data = pd.read_csv(file_path, header=None)
-        data.columns = ["date", "description", "charge", "payment", "balance"]
-        data["date"] = pd.to_datetime(data["date"])
-        # check if dates are in increasing order
-        if not data["date"].is_monotonic_increasing:
-            # reverse the order of the DataFrame
-            data = data.iloc[::-1]
+        try:
+            data = super()._load_csv_data(file_path)
+        except UnicodeDecodeError:
+            # keep only columns 2, 3, 5, 7, 8, 13, parsed straight to their types
+            data = pd.read_csv(
+                file_path,
+                header=None,
+                encoding="latin1",
+                usecols=[2, 3, 5, 7, 8, 13],
+                dtype={
+                    2: "string",
+                    5: "string",
+                    7: "float64",
+                    8: "float64",
+                    13: "float64",
+                },
+                parse_dates=[3],
+            )
+            data.columns = [
+                "account",
+                "date",
+                "description",
+                "withdrawal",
+                "deposit",
+                "balance",
+            ]
+            # find most common account name and keep only rows with that account name
+            data = _ensure_dates(data, file_path)
+            account_name = data["account"].mode()[0]
+            data = data[data["account"] == account_name]
+            data = data.drop(columns=["account"])
+            return self._sort_by_date(data)
+        # replace multiple spaces with single space
+        data["description"] = data["description"].str.replace(
+            _MULTISPACE, " ", regex=True
+        )
         return data
 
-    def _update_db_from_data(self, data: pd.DataFrame):
-        """
-        Update the database with data from a DataFrame.
+    @staticmethod
+    def _clean_descriptions(descriptions: pd.Series) -> pd.Series:
+        # stored without surrounding spaces (descriptions used to be padded
+        # to 20 characters, see _migrate)
+        return descriptions.str.strip()
 
-        Parameters
-        ----------
-        data : pd.DataFrame
-            A DataFrame containing transaction data. Must have columns:
-            - description: str
-            - date: datetime
-            - charge: float
-            - payment: float
-            - balance: float
-        """
-        for _, row in data.iterrows():
-            self._add_transaction(
-                description=row["description"],
-                date=row["date"],
-                charge=row["charge"],
-                payment=row["payment"],
-                balance=row["balance"],
-            )
 
-    def get_balance(self) -> float:
-        """
-        Get the current balance of the account.
+class CreditAccount(_AccountBase):
+    """
+    A credit card account. CSV files added with add_data must have columns, in order (no header):
+    - date (and optionally time): str (format: "YYYY-MM-DD HH:MM:SS" or "YYYY-MM-DD")
+    - description: str
+    - charge: float
+    - payment: float
+    - balance: float
+    """
 
-        Returns
-        -------
-        float
-            The current balance of the account.
-        """
-        most_recent_transaction = self.query().transactions(
-            as_list=True,
-        )[-1]
-        if most_recent_transaction is None:
-            raise ValueError("No transactions found")
-        return most_recent_transaction.balance
+    model_cls = CreditTransaction
+    subdir = "credit"
+    amount_cols = ("charge", "payment")
+    csv_columns = ["date", "description", "charge", "payment", "balance"]
 
-    def check_validity(self):
-        """
-        Check if the transactions in the database are valid.
 
-        Returns
-        -------
-        bool
-            True if the transactions are valid, False otherwise.
-        """
-        total_transactions = round(self.query().sum(), 2)
-        first_transaction = self.query().transactions(as_list=True)[0]
-        # first balance is actually the balance AFTER the first transaction, so we need to remove the first transaction amount
-        if first_transaction.charge is not None:
-            first_balance = first_transaction.balance - first_transaction.charge
-        else:
-            first_balance = first_transaction.balance + first_transaction.payment
-        last_balance = self.get_balance()
+@lru_cache(maxsize=1024)
+def _parse_iso(date_string: str) -> datetime:
+    """
+    Parse an ISO 8601 date string. Cached, since the same date windows are applied over and over.
 
-        diff_balance = round(last_balance - first_balance, 2)
+    Parameters
+    ----------
+    date_string : str
+        The date (and optionally time), in ISO 8601 format.
 
-        return total_transactions == diff_balance
+    Returns
+    -------
+    datetime
+        The parsed date.
+    """
+    return datetime.fromisoformat(date_string)
 
-    def close_session(self):
-        """
-        Close the database session.
-        """
-        self.session.close()
 
-    def query(self):
-        """
-        Execute a custom query on the database.
+def _exclusive_end(date_end: datetime) -> datetime:
+    """
+    Convert the inclusive end of a date range to an exclusive one.
 
-        Parameters
-        ----------
-        query_str : str
-            The query string to execute.
-        """
+    Parameters
+    ----------
+    date_end : datetime
+        The last date (and optionally time) included in the range. A date without a time of day includes the whole day.
+
+    Returns
+    -------
+    datetime
+        The first date and time after the range.
+    """
+    if date_end.time() == time.min:
+        return date_end + timedelta(days=1)
+    return date_end + timedelta(microseconds=1)
+
+
+def _period_range(period_type: str, period: str) -> tuple[datetime, datetime]:
+    """
+    Get the half-open date range of a period, as labelled by TransactionQuery.group_by.
+
+    Parameters
+    ----------
+    period_type : str
+        The kind of period: 'day', 'week', 'month' or 'year'.
+    period : str
+        The period label: YYYY-MM-DD, YYYY-WW (SQLite's %W week, starting on Monday), YYYY-MM or YYYY.
+
+    Returns
+    -------
+    tuple[datetime, datetime]
+        The start of the period, and the start of the one after it.
+    """
+    if period_type == "day":
+        start = datetime.fromisoformat(period)
+        return start, start + timedelta(days=1)
+    if period_type == "year":
+        year = int(period)
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    year, number = (int(part) for part in period.split("-"))
+    if period_type == "month":
+        start = datetime(year, number, 1)
+        if number == 12:
+            return start, datetime(year + 1, 1, 1)
+        return start, datetime(year, number + 1, 1)
+    # week 00 holds the days before the first Monday of the year, and the
+    # last week stops at the end of the year
+    new_year = datetime(year, 1, 1)
+    first_monday = new_year + timedelta(days=-new_year.weekday() % 7)
+    if number == 0:
+        return new_year, first_monday
+    start = first_monday + timedelta(weeks=number - 1)
+    return start, min(start + timedelta(weeks=1), datetime(year + 1, 1, 1))
+
+
+@lru_cache(maxsize=256)
+def _description_clause(transaction_type, keywords: tuple[str, ...]):
+    """
+    Build the clause matching descriptions that contain any of the keywords.
+
+    Category filters apply the same keyword lists over and over, so the clauses are cached. Pass the
+    keywords sorted, so the same keywords in any order share a cache entry, and negate the clause to
+    match descriptions containing none of them.
 
-        return TransactionQuery(self.session, CreditTransaction)
+    Parameters
+    ----------
+    transaction_type : type[Base]
+        The transaction model to filter.
+    keywords : tuple[str, ...]
+        The keywords to look for.
+
+    Returns
+    -------
+    ColumnElement
+        The filter clause.
+    """
+    return or_(
+        *[transaction_type.description.contains(keyword) for keyword in keywords]
+    )
+
+
+def _canonical_order(clauses: list) -> list:
+    # Filter clauses in a canonical order, sorted by the hash of their cache
+    # key: it leaves out bound values and is much cheaper to build than
+    # compiling each clause to a string. Clauses of the same shape keep the
+    # order they were applied in, and give the same statement either way.
+    # _generate_cache_key is SQLAlchemy internals (the key its own compiled
+    # cache uses), not public API; it returns None for clauses that can't be
+    # cached, and then the clauses are left in the order they were applied.
+    cache_keys = [clause._generate_cache_key() for clause in clauses]
+    if any(cache_key is None for cache_key in cache_keys):
+        return list(clauses)
+    hashes = [hash(cache_key.key) for cache_key in cache_keys]
+    return [
+        clause for _, clause in sorted(zip(hashes, clauses), key=lambda pair: pair[0])
+    ]
+
+
+# the columns increasing ("pos") and decreasing ("neg") the balance of each model
+_COL_MAP = {
+    DebitTransaction: {
+        "pos": DebitTransaction.deposit,
+        "neg": DebitTransaction.withdrawal,
+    },
+    CreditTransaction: {
+        "pos": CreditTransaction.charge,
+        "neg": CreditTransaction.payment,
+    },
+}
 
 
 class TransactionQuery:
     def __init__(self, session, transaction_type):
         self.session = session
         self.transaction_type = transaction_type
+        self.cols = _COL_MAP[transaction_type]
         self.query = session.query(self.transaction_type)
+        # filter clauses, applied to the statement only when it is executed
+        self._predicates = []
+        # ORDER BY clauses, applied along with the filters
+        self._order = []
+        # set when the filters can't match any transaction
+        self._empty = False
         self.group_by_attr = None
 
+    def _filter(self, *clauses):
+        self._predicates.extend(clauses)
+        return self
+
+    def _canonical_predicates(self):
+        # sorted so the same filters give the same SQL, and hit the same
+        # compiled statement cache entry, whatever order they were applied in
+        return _canonical_order(self._predicates)
+
+    def _finalize(self):
+        return self.query.filter(*self._canonical_predicates()).order_by(*self._order)
+
+    def _select(self, *columns, group_by=None, order_by=()):
+        # aggregates and DataFrames don't need ORM result processing, so they
+        # run as plain Core selects over the filtered transactions
+        stmt = (
+            select(*columns)
+            .select_from(self.transaction_type)
+            .where(*self._canonical_predicates())
+        )
+        if group_by is not None:
+            stmt = stmt.group_by(group_by)
+        if order_by:
+            stmt = stmt.order_by(*order_by)
+        return stmt
+
     def filter_transactions(self, include: bool, transaction_field):
         if not include:
-            self.query = self.query.filter(transaction_field.is_(None))
+            self._filter(transaction_field.is_(None))
         return self
 
     def filter_deposits(self, include: bool):
-        if self.transaction_type == DebitTransaction:
-            return self.filter_transactions(include, DebitTransaction.deposit)
+        if self.transaction_type is DebitTransaction:
+            return self.filter_transactions(include, self.cols["pos"])
         return self
 
     def filter_withdrawals(self, include: bool):
-        if self.transaction_type == DebitTransaction:
-            return self.filter_transactions(include, DebitTransaction.withdrawal)
+        if self.transaction_type is DebitTransaction:
+            return self.filter_transactions(include, self.cols["neg"])
         return self
 
     def filter_charges(self, include: bool):
-        if self.transaction_type == CreditTransaction:
-            return self.filter_transactions(include, CreditTransaction.charge)
+        if self.transaction_type is CreditTransaction:
+            return self.filter_transactions(include, self.cols["pos"])
         return self
 
     def filter_payments(self, include: bool):
-        if self.transaction_type == CreditTransaction:
-            return self.filter_transactions(include, CreditTransaction.payment)
+        if self.transaction_type is CreditTransaction:
+            return self.filter_transactions(include, self.cols["neg"])
         return self
 
     def filter_date_range(
@@ -810,77 +1220,90 @@ class TransactionQuery:
         invert: bool = False,
     ):
         if isinstance(date_start, str):
-            date_start = datetime.fromisoformat(date_start)
+            date_start = _parse_iso(date_start)
         if isinstance(date_end, str):
-            date_end = datetime.fromisoformat(date_end)
+            date_end = _parse_iso(date_end)
+
+        # compare against an exclusive end so every range is half-open on the
+        # raw (indexed) date column
+        if date_end is not None:
+            date_end = _exclusive_end(date_end)
+        if (
+            not invert
+            and date_start is not None
+            and date_end is not None
+            and date_start >= date_end
+        ):
+            self._empty = True
 
         if date_start is not None and date_end is not None:
             if invert:
-                self.query = self.query.filter(
+                self._filter(
                     or_(
                         self.transaction_type.date < date_start,
-                        self.transaction_type.date > date_end,
+                        self.transaction_type.date >= date_end,
                     )
                 )
             else:
-                self.query = self.query.filter(
+                self._filter(
                     self.transaction_type.date >= date_start,
-                    self.transaction_type.date <= date_end,
+                    self.transaction_type.date < date_end,
                 )
         elif date_start is not None:
             if invert:
-                self.query = self.query.filter(self.transaction_type.date < date_start)
+                self._filter(self.transaction_type.date < date_start)
             else:
-                self.query = self.query.filter(self.transaction_type.date >= date_start)
+                self._filter(self.transaction_type.date >= date_start)
         elif date_end is not None:
             if invert:
-                self.query = self.query.filter(self.transaction_type.date > date_end)
+                self._filter(self.transaction_type.date >= date_end)
             else:
-                self.query = self.query.filter(self.transaction_type.date <= date_end)
+                self._filter(self.transaction_type.date < date_end)
 
         return self
 
+    def filter_period(self, period: str):
+        if self.group_by_attr is None:
+            raise ValueError(
+                "Call group_by first: the period must be in the format of its groups."
+            )
+        # a range on the raw (indexed) date column rather than a comparison
+        # against the strftime group label
+        try:
+            start, end = _period_range(self.group_by_attr, period)
+        except ValueError:
+            raise ValueError(
+                f"Invalid {self.group_by_attr} period '{period}'."
+            ) from None
+        if start >= end:
+            self._empty = True
+        return self._filter(
+            self.transaction_type.date >= start, self.transaction_type.date < end
+        )
+
     def filter_description(
         self,
-        description_contains: Optional[Union[str, list[str]]] = None,
+        description_contains: Optional[Union[str, list[str], tuple[str, ...]]] = None,
         invert: bool = False,
     ):
-        if description_contains is not None:
-            if isinstance(description_contains, str):
-                if invert:
-                    self.query = self.query.filter(
-                        ~self.transaction_type.description.contains(
-                            description_contains
-                        )
-                    )
-                else:
-                    self.query = self.query.filter(
-                        self.transaction_type.description.contains(description_contains)
-                    )
-            elif isinstance(description_contains, list):
-                if invert:
-                    self.query = self.query.filter(
-                        ~or_(
-                            *[
-                                self.transaction_type.description.contains(keyword)
-                                for keyword in description_contains
-                            ]
-                        )
-                    )
-                else:
-                    self.query = self.query.filter(
-                        or_(
-                            *[
-                                self.transaction_type.description.contains(keyword)
-                                for keyword in description_contains
-                            ]
-                        )
-                    )
-            else:
-                raise ValueError(
-                    "description_contains must be a string or a list of strings. Use the output of the categories(name: str) function to filter by categories."
-                )
-        return self
+        if description_contains is None:
+            return self
+        if isinstance(description_contains, str):
+            keywords = (description_contains,)
+        elif isinstance(description_contains, (list, tuple)):
+            keywords = tuple(sorted(description_contains))
+        else:
+            raise ValueError(
+                "description_contains must be a string or a list of strings. Use the output of the categories(name: str) function to filter by categories."
+            )
+        if not keywords:
+            # no keyword to contain: nothing matches, and inverted everything does
+            if not invert:
+                self._empty = True
+                self._filter(false())
+            return self
+        clause = _description_clause(self.transaction_type, keywords)
+        return self._filter(~clause if invert else clause)
 
     def filter_amount(
         self,
@@ -888,80 +1311,65 @@ class TransactionQuery:
         max_amount: Optional[float] = None,
         invert: bool = False,
     ):
-        if self.transaction_type == DebitTransaction:
-            deposit_col = DebitTransaction.deposit
-            withdrawal_col = DebitTransaction.withdrawal
-        elif self.transaction_type == CreditTransaction:
-            deposit_col = CreditTransaction.charge
-            withdrawal_col = CreditTransaction.payment
+        deposit_col = self.cols["pos"]
+        withdrawal_col = self.cols["neg"]
 
+        if (
+            not invert
+            and min_amount is not None
+            and max_amount is not None
+            and min_amount > max_amount
+        ):
+            self._empty = True
+
+        if not invert:
+            # one range on the indexed abs(signed_amount) expression instead
+            # of an OR of two ranges, which SQLite can't serve from an index
+            amount = func.abs(self.transaction_type.signed_amount)
+            if min_amount is not None and max_amount is not None:
+                self._filter(amount.between(min_amount, max_amount))
+            elif min_amount is not None:
+                self._filter(amount >= min_amount)
+            elif max_amount is not None:
+                self._filter(amount <= max_amount)
+            if (min_amount is not None or max_amount is not None) and (
+                min_amount is None or min_amount <= 0
+            ):
+                # a missing amount counts as 0 in signed_amount, but
+                # transactions without any amount never matched before
+                self._filter(or_(deposit_col.is_not(None), withdrawal_col.is_not(None)))
+            return self
+
+        # inverted: either amount column outside the range
         if min_amount is not None and max_amount is not None:
-            if invert:
-                self.query = self.query.filter(
-                    or_(
-                        deposit_col < min_amount,
-                        deposit_col > max_amount,
-                        withdrawal_col < min_amount,
-                        withdrawal_col > max_amount,
-                    )
-                )
-            else:
-                self.query = self.query.filter(
-                    or_(
-                        and_(deposit_col >= min_amount, deposit_col <= max_amount),
-                        and_(
-                            withdrawal_col >= min_amount, withdrawal_col <= max_amount
-                        ),
-                    )
+            self._filter(
+                or_(
+                    deposit_col < min_amount,
+                    deposit_col > max_amount,
+                    withdrawal_col < min_amount,
+                    withdrawal_col > max_amount,
                 )
+            )
         elif min_amount is not None:
-            if invert:
-                self.query = self.query.filter(
-                    or_(deposit_col < min_amount, withdrawal_col < min_amount)
-                )
-            else:
-                self.query = self.query.filter(
-                    or_(deposit_col >= min_amount, withdrawal_col >= min_amount)
-                )
+            self._filter(or_(deposit_col < min_amount, withdrawal_col < min_amount))
         elif max_amount is not None:
-            if invert:
-                self.query = self.query.filter(
-                    or_(deposit_col > max_amount, withdrawal_col > max_amount)
-                )
-            else:
-                self.query = self.query.filter(
-                    or_(deposit_col <= max_amount, withdrawal_col <= max_amount)
-                )
+            self._filter(or_(deposit_col > max_amount, withdrawal_col > max_amount))
 
         return self
 
     def _order_by(self, field: str, ascending: bool = True):
+        # replaces any earlier ordering, so running the same query again
+        # doesn't stack a second ORDER BY onto it
         if field == "date":
-            if ascending:
-                self.query = self.query.order_by(self.transaction_type.date)
-            else:
-                self.query = self.query.order_by(self.transaction_type.date.desc())
+            order = self.transaction_type.date
         elif field == "amount":
-            if self.transaction_type == DebitTransaction:
-                amount = func.coalesce(DebitTransaction.deposit, 0) - func.coalesce(
-                    DebitTransaction.withdrawal, 0
-                )
-            elif self.transaction_type == CreditTransaction:
-                amount = func.coalesce(CreditTransaction.charge, 0) - func.coalesce(
-                    CreditTransaction.payment, 0
-                )
-            if ascending:
-                self.query = self.query.order_by(func.abs(amount))
-            else:
-                self.query = self.query.order_by(func.abs(amount).desc())
-
+            # matches the expression of the abs_amount index
+            order = func.abs(self.transaction_type.signed_amount)
         elif field == "description":
-            if ascending:
-                self.query = self.query.order_by(self.transaction_type.description)
-            else:
-                self.query = self.query.order_by(
-                    self.transaction_type.description.desc()
-                )
+            order = self.transaction_type.description
+        else:
+            return self
+        self._order = [order if ascending else order.desc()]
         return self
 
     def transactions(
@@ -982,40 +1390,73 @@ class TransactionQuery:
             self._order_by("date", ascending)
 
         if as_list:
-            return self.query.all()
+            return self._finalize().all()
         else:
-            self.transactions_list = self.query.order_by(
-                self.transaction_type.date
-            ).all()
-            transactions_dicts = [to_dict(txn) for txn in self.transactions_list]
-            df = pd.DataFrame(transactions_dicts)
+            # stream plain rows instead of ORM objects and gather them column
+            # by column, so pandas builds each column from a single list
+            columns = [
+                c for c in self.transaction_type.__table__.columns if c.key != "id"
+            ]
+            order = list(self._order)
+            if order_by_amount or order_by_description:
+                # keep ties in chronological order; a date ordering is
+                # already on the statement otherwise
+                order.append(self.transaction_type.date)
+            # options are passed per execution so the session's connection
+            # keeps buffering results for everything else
+            result = self.session.execute(
+                self._select(*columns, order_by=order),
+                execution_options={
+                    "stream_results": True,
+                    "max_row_buffer": _FETCH_BATCH_SIZE,
+                    "yield_per": _FETCH_BATCH_SIZE,
+                },
+            )
+            data = {column.key: [] for column in columns}
+            for partition in result.partitions():
+                for values, column_values in zip(data.values(), zip(*partition)):
+                    values.extend(column_values)
+            df = pd.DataFrame(data)
             return df
 
+    def _aggregate(self, sort: Optional[str] = None, ascending: bool = True):
+        # count, total and average computed together in a single pass over the
+        # filtered transactions, overall or per period
+        amount = self.transaction_type.signed_amount
+        metrics = [
+            func.count().label("count"),
+            func.sum(amount).label("sum"),
+            func.avg(amount).label("average"),
+        ]
+        if not self.group_by_attr:
+            return self.session.execute(self._select(*metrics)).one()
+        period = self._group_by_period()
+        period_col = period.label("period")
+        # sorted by the database rather than in pandas
+        sort_col = {metric.name: metric for metric in metrics}.get(sort, period_col)
+        order = [sort_col if ascending else sort_col.desc()]
+        if sort is not None:
+            order.append(period_col)
+        result = self.session.execute(
+            self._select(period_col, *metrics, group_by=period, order_by=order)
+        ).all()
+        return pd.DataFrame(result, columns=["period", "count", "sum", "average"])
+
     def count(
         self,
         order_by_count: bool = False,
         ascending: bool = True,
     ) -> int | pd.DataFrame:
+        if self._empty:
+            # the filters can't match anything, no need to ask the database
+            if self.group_by_attr:
+                return pd.DataFrame(columns=["period", "count"])
+            return 0
+        result = self._aggregate("count" if order_by_count else None, ascending)
         if self.group_by_attr:
-            period = self._group_by_period()
-            result = (
-                self.query.with_entities(
-                    period.label("period"), func.count().label("count")
-                )
-                .group_by(period)
-                .all()
-            )
-            df = pd.DataFrame(result, columns=["period", "count"])
-            if order_by_count:
-                df = df.sort_values(by="count", ascending=ascending)
-                # reset index to start from 0
-                df.reset_index(drop=True, inplace=True)
-            else:
-                df = df.sort_values(by="period", ascending=ascending)
-                # reset index to start from 0
-                df.reset_index(drop=True, inplace=True)
-            return df
-        return self.query.count()
+            return result[["period", "count"]]
+        count, total, average = result
+        return count
 
     def sum(
         self,
@@ -1023,91 +1464,28 @@ class TransactionQuery:
         order_by_sum: bool = False,
         ascending: bool = True,
     ) -> float | pd.DataFrame:
+        if self._empty:
+            if self.group_by_attr:
+                return pd.DataFrame(columns=["period", "sum"])
+            return 0.0
+        result = self._aggregate("sum" if order_by_sum else None, ascending)
         if self.group_by_attr:
-            period = self._group_by_period()
-            if self.transaction_type == DebitTransaction:
-                result = (
-                    self.query.with_entities(
-                        period.label("period"),
-                        func.coalesce(func.sum(DebitTransaction.deposit), 0).label(
-                            "deposit_sum"
-                        ),
-                        func.coalesce(func.sum(DebitTransaction.withdrawal), 0).label(
-                            "withdrawal_sum"
-                        ),
-                    )
-                    .group_by(period)
-                    .all()
-                )
-                df = pd.DataFrame(
-                    result, columns=["period", "deposit_sum", "withdrawal_sum"]
-                )
-                df["sum"] = df["deposit_sum"] - df["withdrawal_sum"]
-                df.drop(columns=["deposit_sum", "withdrawal_sum"], inplace=True)
-            elif self.transaction_type == CreditTransaction:
-                result = (
-                    self.query.with_entities(
-                        period.label("period"),
-                        func.coalesce(func.sum(CreditTransaction.charge), 0).label(
-                            "charge_sum"
-                        ),
-                        func.coalesce(func.sum(CreditTransaction.payment), 0).label(
-                            "payment_sum"
-                        ),
-                    )
-                    .group_by(period)
-                    .all()
-                )
-                df = pd.DataFrame(
-                    result, columns=["period", "charge_sum", "payment_sum"]
-                )
-                df["sum"] = df["charge_sum"] - df["payment_sum"]
-                df.drop(columns=["charge_sum", "payment_sum"], inplace=True)
-
-            if order_by_sum:
-                df.sort_values(by="sum", ascending=ascending, inplace=True)
-            else:
-                df.sort_values(by="period", ascending=ascending, inplace=True)
-
-            df.reset_index(drop=True, inplace=True)
-            return df
-
-        if self.transaction_type == DebitTransaction:
-            deposit, withdrawal = self.query.with_entities(
-                func.coalesce(func.sum(DebitTransaction.deposit), 0),
-                func.coalesce(func.sum(DebitTransaction.withdrawal), 0),
-            ).one()
-            total = round((deposit or 0) - (withdrawal or 0), 2)
-        elif self.transaction_type == CreditTransaction:
-            charge, payment = self.query.with_entities(
-                func.coalesce(func.sum(CreditTransaction.charge), 0),
-                func.coalesce(func.sum(CreditTransaction.payment), 0),
-            ).one()
-            total = round((charge or 0) - (payment or 0), 2)
-
-        return total
+            return result[["period", "sum"]]
+        count, total, average = result
+        return round(total, 2) if count else 0.0
 
     def average(self) -> float | pd.DataFrame:
+        if self._empty:
+            if self.group_by_attr:
+                return pd.DataFrame(columns=["period", "average"])
+            raise ValueError("No transactions found for the specified criteria.")
+        result = self._aggregate()
         if self.group_by_attr:
-            period = self._group_by_period()
-            result = (
-                self.query.with_entities(
-                    period.label("period"),
-                    func.avg(
-                        func.coalesce(self.transaction_type.deposit, 0)
-                        - func.coalesce(self.transaction_type.withdrawal, 0)
-                    ).label("average"),
-                )
-                .group_by(period)
-                .all()
-            )
-            df = pd.DataFrame(result, columns=["period", "average"])
-            return df
-        total = self.sum()
-        count = self.count()
+            return result[["period", "average"]]
+        count, total, average = result
         if count == 0:
             raise ValueError("No transactions found for the specified criteria.")
-        return total / count
+        return round(total, 2) / count
 
     def group_by(self, period: str):
         if period not in {"day", "week", "month", "year"}:
@@ -1130,11 +1508,17 @@ class TransactionQuery:
             return None
 
     def get_transactions_with_no_category(self):
-        categories = CategoryManager().get_all_categories()
-
-        for cat in categories:
-            cat = category(cat)
-            self.filter_description(description_contains=cat, invert=True)
+        # one manager for every category, rather than one more per category
+        manager = CategoryManager()
+        # a single NOT (... OR ...) over every distinct keyword instead of one
+        # clause per category
+        keywords = set(
+            chain.from_iterable(
+                manager.get_keywords(cat) for cat in manager.get_all_categories()
+            )
+        )
+        if keywords:
+            self.filter_description(description_contains=list(keywords), invert=True)
         return self.transactions()
 
 
@@ -1143,7 +1527,19 @@ def category(name: str):
     return cat.get_keywords(name)
 
 
+@lru_cache(maxsize=None)
+def _column_keys(cls):
+    # The keys of the table columns of a model, excluding the id column
+    return tuple(c.key for c in cls.__table__.columns if c.key != "id")
+
+
 def to_dict(obj):
     # Convert an SQLAlchemy object to a dictionary
     # Exclude the id column
-    return {c.key: getattr(obj, c.key) for c in obj.__table__.columns if c.key != "id"}
+    # Loaded attributes are read from __dict__ directly, bypassing the ORM
+    # descriptors; expired or unloaded ones still go through getattr
+    state = obj.__dict__
+    return {
+        key: state[key] if key in state else getattr(obj, key)
+        for key in _column_keys(type(obj))
+    }
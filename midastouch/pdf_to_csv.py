@@ -1,16 +1,112 @@
 import os
 import re
-from datetime import date, datetime
 
+import numpy as np
 import pandas as pd
 import pdftotext
 
+# Month abbreviations printed on the statements (French, some accents mangled)
+_MONTHS = {
+    "JAN": 1,
+    "F¯V": 2,
+    "MAR": 3,
+    "AVR": 4,
+    "MAI": 5,
+    "JUN": 6,
+    "JUL": 7,
+    "AO": 8,
+    "SEP": 9,
+    "OCT": 10,
+    "NOV": 11,
+    "DÉC": 12,
+    "D¯C": 12,
+}
+# day and month of a date such as 30JUL or 03JUN
+_DATE_RE = re.compile(r"^(\d\d)(" + "|".join(map(re.escape, _MONTHS)) + ")")
+# a line made of numbers, spaces and commas only: the page totals
+_TOTALS_RE = re.compile(r"^[0-9, \xa0]+$")
+# the two amounts of the totals line: withdrawals, then deposits, at least two
+# spaces apart (single, possibly non-breaking, spaces separate thousands)
+_TOTALS_CAPTURE = re.compile(r"(\d[\d, \xa0]*?\d)\s{2,}(\d[\d, \xa0]*\d)")
+_MULTISPACE_RE = re.compile(" +")
+# amounts use decimal commas, and (non-breaking) spaces between thousands
+_AMOUNT_TABLE = str.maketrans({",": ".", " ": "", "\xa0": ""})
+
+
+def _parse_totals(line: str) -> tuple[float, float]:
+    # total withdrawals and deposits printed at the bottom of a page
+    totals = _TOTALS_CAPTURE.search(line)
+    total_withdrawals = totals.group(1).translate(_AMOUNT_TABLE)
+    total_deposits = totals.group(2).translate(_AMOUNT_TABLE)
+    return float(total_withdrawals), float(total_deposits)
+
+
+def _carry_balances(balance: pd.Series, steps: pd.Series, page: pd.Series) -> pd.Series:
+    # Fill each run of missing balances by adding the steps, in order, to the
+    # known balance before it on the same page. A missing step breaks the run,
+    # and balances with no known one before them stay missing.
+    known = balance.notna()
+    run = (known | page.ne(page.shift())).cumsum()
+    values = balance.where(known, steps)
+    anchored = known.groupby(run).transform("first")
+    broken = values.isna().groupby(run).cummax()
+    return values.groupby(run).cumsum().mask(broken | ~anchored)
+
+
+def _fill_missing_balances(df: pd.DataFrame, page: pd.Series) -> pd.Series:
+    # signed amount of each row, the withdrawal if there is one
+    delta = (-df["Withdrawal"]).fillna(df["Deposit"])
+    # forward from the balance above, then backward from the balance below
+    balance = _carry_balances(df["Balance"], delta, page)
+    backward = _carry_balances(balance[::-1], -delta.shift(-1)[::-1], page[::-1])
+    return backward[::-1]
+
+
+def _first_column(found: np.ndarray, start: int) -> int:
+    # first column from start on where found is set, 10000 if there is none
+    columns = np.flatnonzero(found[start:])
+    return start + int(columns[0]) if len(columns) else 10000
+
+
+def _column_starts(lines: list[str]) -> tuple[int, int, int, int]:
+    # Character grid of the lines, padded with spaces. UTF-32 keeps one element
+    # per character, so columns line up even with accented characters.
+    width = max(max(map(len, lines), default=0), 1)
+    grid = (
+        np.array([line.ljust(width) for line in lines], dtype=f"<U{width}")
+        .view("<u4")
+        .reshape(len(lines), width)
+    )
+    nonspace = grid != ord(" ")
+    # columns where some line has a character, or one after two spaces
+    any_char = nonspace.any(axis=0)
+    after_gap = np.zeros(width, dtype=bool)
+    after_gap[2:] = (nonspace[:, 2:] & ~nonspace[:, 1:-1] & ~nonspace[:, :-2]).any(
+        axis=0
+    )
+
+    start_withdrawals = _first_column(any_char, 40)
+    start_deposits = _first_column(after_gap, start_withdrawals + 10)
+    start_dates = _first_column(any_char, start_deposits + 10)
+    start_balance = _first_column(any_char, start_dates + 10)
+    return start_withdrawals, start_deposits, start_dates, start_balance
+
 
 def convert_td_statement_to_csv(file_name: str, year: int):
     with open(file_name, "rb") as file:
         pdf = pdftotext.PDF(file, physical=True)
 
-    dataframes = []
+    # rows of every page, gathered column by column and converted all at once
+    columns = {
+        "Date": [],
+        "Description": [],
+        "Withdrawal": [],
+        "Deposit": [],
+        "Balance": [],
+    }
+    # page number of each row, and the totals printed on each page
+    pages = []
+    page_totals = []
     counter = 0
     for page in pdf:
         counter += 1
@@ -32,153 +128,85 @@ def convert_td_statement_to_csv(file_name: str, year: int):
                 lines = lines[:i]
                 break
             # if line contains only numbers, spaces, and commas, it is a total line
-            elif re.match(r"^[0-9, ]+$", line.strip()):
+            elif _TOTALS_RE.match(line.strip()):
                 totals = line
                 lines = lines[:i]
                 break
-        totals = totals.split("    ")
-        totals = list(filter(None, totals))
-        total_withdrawals = totals[0].strip().replace(",", ".").replace(" ", "")
-        total_deposits = totals[1].strip().replace(",", ".").replace(" ", "")
+        page_totals.append(_parse_totals(totals))
 
         # make new list of the 30 first characters of each line (and clean up the lines)
         descriptions = [line[:40].strip() for line in lines]
-        descriptions = [re.sub(" +", " ", line) for line in descriptions]
+        descriptions = [_MULTISPACE_RE.sub(" ", line) for line in descriptions]
         # add space to the end to normalize length to 20
         descriptions = [line + " " * (20 - len(line)) for line in descriptions]
 
         # find start positions of columns
-        start_withdrawals = 10000
-        for line in lines:
-            for i in range(40, len(line)):
-                if line[i] != " ":
-                    start_withdrawals = min(start_withdrawals, i)
-                    break
-
-        prev = start_withdrawals + 10
-        start_deposits = 10000
-        for line in lines:
-            for i in range(prev, len(line)):
-                if line[i] != " " and line[i - 1] == " " and line[i - 2] == " ":
-                    start_deposits = min(start_deposits, i)
-                    break
-
-        prev = start_deposits + 10
-        start_dates = 10000
-        for line in lines:
-            for i in range(prev, len(line)):
-                if line[i] != " ":
-                    start_dates = min(start_dates, i)
-                    break
-
-        prev = start_dates + 10
-        start_balance = 10000
-        for line in lines:
-            for i in range(prev, len(line)):
-                if line[i] != " ":
-                    start_balance = min(start_balance, i)
-                    break
+        start_withdrawals, start_deposits, start_dates, start_balance = _column_starts(
+            lines
+        )
 
         # makes a list of the rest of the lines
-
-        withdrawals = [
+        columns["Description"].extend(descriptions)
+        columns["Withdrawal"].extend(
             line[start_withdrawals - 1 : start_deposits - 5].strip() for line in lines
-        ]
-
-        deposits = [
+        )
+        columns["Deposit"].extend(
             line[start_deposits - 1 : start_dates - 2].strip() for line in lines
-        ]
-
-        dates = [line[start_dates - 1 : start_balance - 5].strip() for line in lines]
-
-        balance = [line[start_balance - 1 :].strip() for line in lines]
+        )
+        columns["Date"].extend(
+            line[start_dates - 1 : start_balance - 5].strip() for line in lines
+        )
+        columns["Balance"].extend(line[start_balance - 1 :].strip() for line in lines)
+        pages.extend([counter] * len(lines))
 
-        # Print all lines by adding | at start_ positions defined above
-        for i in range(len(lines)):
+        # Print all lines by adding | at start_ positions defined above, when
+        # debugging (MIDAS_DEBUG set), in a single write per page
+        if os.environ.get("MIDAS_DEBUG"):
             print(
-                f"{lines[i][:start_withdrawals-1]}|{lines[i][start_withdrawals:start_deposits-1]}|{lines[i][start_deposits:start_dates-1]}|{lines[i][start_dates:start_balance-1]}|{lines[i][start_balance:]}"
+                "\n".join(
+                    f"{line[:start_withdrawals-1]}|{line[start_withdrawals:start_deposits-1]}|{line[start_deposits:start_dates-1]}|{line[start_dates:start_balance-1]}|{line[start_balance:]}"
+                    for line in lines
+                )
             )
 
-        # Dates are formatted as, for example, 30JUL or 03JUN (month and day). Convert to datetime
-        dates = [date.replace("JAN", "Jan") for date in dates]
-        dates = [date.replace("F¯V", "Feb") for date in dates]
-        dates = [date.replace("MAR", "Mar") for date in dates]
-        dates = [date.replace("AVR", "Apr") for date in dates]
-        dates = [date.replace("MAI", "May") for date in dates]
-        dates = [date.replace("JUN", "Jun") for date in dates]
-        dates = [date.replace("JUL", "Jul") for date in dates]
-        dates = [date.replace("AO", "Aug") for date in dates]
-        dates = [date.replace("SEP", "Sep") for date in dates]
-        dates = [date.replace("OCT", "Oct") for date in dates]
-        dates = [date.replace("NOV", "Nov") for date in dates]
-        dates = [date.replace("DÉC", "Dec") for date in dates]
-        dates = [date.replace("D¯C", "Dec") for date in dates]
-        abbreviated_month_names = []
-        for month in range(1, 13):
-            date_obj = date(year=2021, month=month, day=1)
-            abbreviated_month_names.append(date_obj.strftime("%b"))
-
-        # turn dates into datetime objects
-        for i in range(len(dates)):
-            month_name = dates[i][2:5]
-            month = abbreviated_month_names.index(month_name) + 1
-            day = int(dates[i][:2])
-            year = 2021
-            date_obj = datetime(year=year, month=month, day=day)
-            dates[i] = date_obj
-
-        # Convert the lists to a DataFrame
-        df = pd.DataFrame(
+    df = pd.DataFrame(columns, dtype=object)
+    page = pd.Series(pages, dtype="int64")
+
+    # Dates are formatted as, for example, 30JUL or 03JUN (month and day). Convert to datetime
+    day_month = df["Date"].str.extract(_DATE_RE)
+    df["Date"] = pd.to_datetime(
+        pd.DataFrame(
             {
-                "Date": dates,
-                "Description": descriptions,
-                "Withdrawal": withdrawals,
-                "Deposit": deposits,
-                "Balance": balance,
+                "year": year,
+                "month": day_month[1].map(_MONTHS),
+                "day": day_month[0].astype(int),
             }
         )
-        # Replace commas with periods and remove space (used to separate thousands in the PDF file)
-        df["Withdrawal"] = df["Withdrawal"].str.replace(",", ".").str.replace(" ", "")
-        df["Deposit"] = df["Deposit"].str.replace(",", ".").str.replace(" ", "")
-        df["Balance"] = df["Balance"].str.replace(",", ".").str.replace(" ", "")
+    )
 
+    for col in ("Withdrawal", "Deposit", "Balance"):
+        # Replace commas with periods and remove space (used to separate thousands in the PDF file)
+        amounts = df[col].str.translate(_AMOUNT_TABLE)
         # Convert the columns to the correct data types (if empty, write nan)
-        df["Withdrawal"] = pd.to_numeric(df["Withdrawal"], errors="coerce")
-        df["Deposit"] = pd.to_numeric(df["Deposit"], errors="coerce")
-        df["Balance"] = pd.to_numeric(df["Balance"], errors="coerce")
-
-        for i in range(1, len(df)):
-            if pd.isnull(df.loc[i, "Balance"]):
-                if pd.notnull(df.loc[i, "Withdrawal"]):
-                    df.loc[i, "Balance"] = (
-                        df.loc[i - 1, "Balance"] - df.loc[i, "Withdrawal"]  # type: ignore
-                    )
-                elif pd.notnull(df.loc[i, "Deposit"]):
-                    df.loc[i, "Balance"] = df.loc[i - 1, "Balance"] + df.loc[i, "Deposit"]  # type: ignore
-        for i in range(
-            len(df) - 2, -1, -1
-        ):  # Start from the second to last row and move upwards
-            if pd.isnull(df.loc[i, "Balance"]):
-                # Check if next row has a balance to calculate from
-                if pd.notnull(df.loc[i + 1, "Balance"]):
-                    if pd.notnull(df.loc[i + 1, "Withdrawal"]):
-                        df.loc[i, "Balance"] = df.loc[i + 1, "Balance"] + df.loc[i + 1, "Withdrawal"]  # type: ignore
-                    elif pd.notnull(df.loc[i + 1, "Deposit"]):
-                        df.loc[i, "Balance"] = df.loc[i + 1, "Balance"] - df.loc[i + 1, "Deposit"]  # type: ignore
-
-        # Round the balance to two decimals
-        df["Balance"] = df["Balance"].round(2)
-
-        # assert that total withdrawals and deposits are correct
-        assert round(df["Withdrawal"].sum(), 2) == round(float(total_withdrawals), 2)
-        assert round(df["Deposit"].sum(), 2) == round(float(total_deposits), 2)
-
-        dataframes.append(df)
-
-    # Concatenate the DataFrames
-    total_df = pd.concat(dataframes, ignore_index=True)
+        df[col] = pd.to_numeric(amounts, errors="coerce")
+
+    # Fill in the balances the statement only prints once per day
+    df["Balance"] = _fill_missing_balances(df, page)
+
+    # Round the balance to two decimals
+    df["Balance"] = df["Balance"].round(2)
+
+    # assert that total withdrawals and deposits of each page are correct,
+    # summing every page at once with a weighted bincount
+    page_numbers = page.to_numpy()
+    totals = np.array(page_totals).reshape(-1, 2)
+    for col, page_total in zip(("Withdrawal", "Deposit"), totals.T):
+        amounts = np.nan_to_num(df[col].to_numpy(dtype="float64"))
+        sums = np.bincount(page_numbers, weights=amounts, minlength=counter + 1)
+        assert (sums[1:].round(2) == page_total.round(2)).all()
+
     # Save the DataFrame to a CSV file, but remove the column titles
-    total_df.to_csv(file_name[:-4] + ".csv", index=False, header=False)
+    df.to_csv(file_name[:-4] + ".csv", index=False, header=False)
 
 
 if __name__ == "__main__":
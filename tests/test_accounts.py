@@ -0,0 +1,154 @@
+import hashlib
+import os
+import re
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import yaml
+from sqlalchemy import create_engine
+
+from midastouch import CategoryManager, CreditAccount, DebitAccount, accounts
+from midastouch.accounts import DebitTransaction
+
+EXAMPLE_CSV = Path(__file__).parent.parent / "data" / "example.csv"
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    # keep accounts out of the user's data directory
+    monkeypatch.setattr(accounts, "user_data_dir", lambda *args, **kwargs: tmp_path)
+    accounts._clear_caches()
+    yield tmp_path
+    accounts._clear_caches()
+
+
+def _baseline_rows(csv_path):
+    # transactions as the first release stored them: descriptions padded to
+    # 20 characters, and SHA-256 ids
+    data = pd.read_csv(
+        csv_path,
+        header=None,
+        names=["date", "description", "withdrawal", "deposit", "balance"],
+        parse_dates=["date"],
+    )
+    rows = []
+    for row in data.itertuples(index=False):
+        description = re.sub(" +", " ", row.description).ljust(20)
+        identifier = f"{description}:{row.date:%Y-%m-%d %H:%M:%S}:{row.deposit}:{row.withdrawal}:{row.balance}"
+        rows.append(
+            {
+                "id": hashlib.sha256(identifier.encode()).hexdigest(),
+                "description": description,
+                "date": row.date.to_pydatetime(),
+                "deposit": None if pd.isna(row.deposit) else row.deposit,
+                "withdrawal": None if pd.isna(row.withdrawal) else row.withdrawal,
+                "balance": row.balance,
+            }
+        )
+    return rows
+
+
+def test_migrate_baseline_database(data_dir):
+    db_path = data_dir / "debit" / "main.db"
+    db_path.parent.mkdir()
+    rows = _baseline_rows(EXAMPLE_CSV)
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as connection:
+        DebitTransaction.__table__.create(connection)
+        connection.execute(DebitTransaction.__table__.insert(), rows)
+    engine.dispose()
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute("PRAGMA user_version").fetchone() == (0,)
+
+    account = DebitAccount("main")
+    try:
+        assert account.query().count() == len(rows)
+        descriptions = account.query().transactions()["description"]
+        assert (descriptions == descriptions.str.strip()).all()
+
+        # importing the same file again adds nothing
+        account.add_data(str(EXAMPLE_CSV))
+        assert account.query().count() == len(rows)
+        assert account.check_validity()
+    finally:
+        account.close_session()
+        account.engine.dispose()
+
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute("PRAGMA user_version").fetchone() == (
+            accounts._DATA_VERSION,
+        )
+
+
+def test_categories_restored_older_yaml(data_dir):
+    yaml_path = data_dir / "categories.yml"
+    manager = CategoryManager()
+    manager.add_category("food", keywords=["bread"])
+    # read back in a fresh process, which mirrors it to JSON
+    accounts._clear_caches()
+    assert CategoryManager().categories == {"food": {"_keywords": ["bread"]}}
+    restored = {"rent": {"_keywords": ["landlord"]}}
+    # restore an older file, with an earlier modification time than the
+    # JSON mirror written from the current one (like cp -p)
+    yaml_path.write_text(yaml.safe_dump(restored))
+    os.utime(yaml_path, ns=(0, 0))
+    accounts._clear_caches()
+
+    manager = CategoryManager()
+    assert manager.categories == restored
+    manager.add_category("food", keywords=["bread"])
+    accounts._clear_caches()
+    assert CategoryManager().categories == {
+        **restored,
+        "food": {"_keywords": ["bread"]},
+    }
+
+
+def test_add_data_invalid_dates(data_dir):
+    csv_path = data_dir / "bad.csv"
+    csv_path.write_text("2023-01-01,a,1.0,,10\n2023-13-45,b,,2.0,12\n")
+    account = CreditAccount("card", create=True)
+    try:
+        with pytest.raises(ValueError, match="bad.csv"):
+            account.add_data(str(csv_path))
+        assert account.query().count() == 0
+    finally:
+        account.close_session()
+        account.engine.dispose()
+
+
+@pytest.fixture
+def year_ends(data_dir):
+    # transactions at the start and the end of every day around the new
+    # years of 2020 to 2025, which start on every kind of weekday
+    dates = [
+        day + offset
+        for year in range(2020, 2026)
+        for day in pd.date_range(f"{year - 1}-12-15", f"{year}-01-15")
+        for offset in (pd.Timedelta(0), pd.Timedelta(hours=23, minutes=59, seconds=59))
+    ]
+    csv_path = data_dir / "year_ends.csv"
+    csv_path.write_text(
+        "".join(
+            f"{date:%Y-%m-%d %H:%M:%S},Transaction {i},1.0,,{i + 1}.0\n"
+            for i, date in enumerate(dates)
+        )
+    )
+    account = CreditAccount("card", create=True)
+    account.add_data(str(csv_path))
+    yield account
+    account.close_session()
+    account.engine.dispose()
+
+
+@pytest.mark.parametrize("period", ["day", "week", "month", "year"])
+def test_filter_period_matches_groups(year_ends, period):
+    # every period label SQLite groups by selects exactly the transactions
+    # of that group
+    groups = year_ends.query().group_by(period).count()
+    assert groups["count"].sum() == year_ends.query().count()
+    for label, count in zip(groups["period"], groups["count"]):
+        query = year_ends.query().group_by(period).filter_period(label)
+        assert query.count()["count"].tolist() == [count], label
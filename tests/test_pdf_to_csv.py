@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pdftotext")
+
+from midastouch.pdf_to_csv import (
+    _column_starts,
+    _fill_missing_balances,
+    _parse_totals,
+)
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        (
+            "                                        1 234,56        12 345,67",
+            (1234.56, 12345.67),
+        ),
+        ("   0,00    5,00", (0.0, 5.0)),
+        ("        1\xa0234,56     10,00", (1234.56, 10.0)),
+        ("  12,00  1\xa0000\xa0000,00  ", (12.0, 1000000.0)),
+    ],
+)
+def test_parse_totals(line, expected):
+    assert _parse_totals(line) == expected
+
+
+def _fill_row_by_row(page: pd.DataFrame) -> pd.Series:
+    # the balance fill of the first release, one page at a time
+    df = page.reset_index(drop=True).copy()
+    for i in range(1, len(df)):
+        if pd.isnull(df.loc[i, "Balance"]):
+            if pd.notnull(df.loc[i, "Withdrawal"]):
+                df.loc[i, "Balance"] = (
+                    df.loc[i - 1, "Balance"] - df.loc[i, "Withdrawal"]
+                )
+            elif pd.notnull(df.loc[i, "Deposit"]):
+                df.loc[i, "Balance"] = df.loc[i - 1, "Balance"] + df.loc[i, "Deposit"]
+    for i in range(len(df) - 2, -1, -1):
+        if pd.isnull(df.loc[i, "Balance"]) and pd.notnull(df.loc[i + 1, "Balance"]):
+            if pd.notnull(df.loc[i + 1, "Withdrawal"]):
+                df.loc[i, "Balance"] = (
+                    df.loc[i + 1, "Balance"] + df.loc[i + 1, "Withdrawal"]
+                )
+            elif pd.notnull(df.loc[i + 1, "Deposit"]):
+                df.loc[i, "Balance"] = (
+                    df.loc[i + 1, "Balance"] - df.loc[i + 1, "Deposit"]
+                )
+    return df["Balance"]
+
+
+nan = float("nan")
+
+
+@pytest.mark.parametrize(
+    "pages, expected",
+    [
+        # a missing balance between two known ones
+        (
+            [[(nan, 100.0, 200.0), (50.0, nan, nan), (nan, 20.0, 170.0)]],
+            [200, 150, 170],
+        ),
+        # the run stops at the page break, the next page fills from below
+        (
+            [
+                [(nan, nan, 100.0), (10.0, nan, nan)],
+                [(5.0, nan, nan), (nan, 20.0, 105.0)],
+            ],
+            [100, 90, 85, 105],
+        ),
+        # a row with no amount breaks the run from above, the one from below
+        # still reaches it
+        (
+            [[(nan, nan, 100.0), (nan, nan, nan), (10.0, nan, nan), (nan, 5.0, 95.0)]],
+            [100, 100, 90, 95],
+        ),
+        # with nothing known below, the rows after it stay missing
+        ([[(nan, nan, 100.0), (nan, nan, nan), (10.0, nan, nan)]], [100, nan, nan]),
+        # missing balances at the start of a page, filled from below
+        ([[(10.0, nan, nan), (nan, 5.0, nan), (3.0, nan, 42.0)]], [40, 45, 42]),
+    ],
+)
+def test_fill_missing_balances(pages, expected):
+    df = pd.DataFrame(
+        [row for rows in pages for row in rows],
+        columns=["Withdrawal", "Deposit", "Balance"],
+    )
+    page = pd.Series([number for number, rows in enumerate(pages) for _ in rows])
+    filled = _fill_missing_balances(df, page).round(2).reset_index(drop=True)
+    reference = pd.concat(
+        [_fill_row_by_row(df[page == number]) for number in range(len(pages))],
+        ignore_index=True,
+    ).round(2)
+    pd.testing.assert_series_equal(filled, reference, check_names=False)
+    pd.testing.assert_series_equal(
+        filled, pd.Series(expected, dtype="float64"), check_names=False
+    )
+
+
+def _column_starts_by_loop(lines):
+    # the column search of the first release, character by character
+    start_withdrawals = 10000
+    for line in lines:
+        for i in range(40, len(line)):
+            if line[i] != " ":
+                start_withdrawals = min(start_withdrawals, i)
+                break
+    start_deposits = 10000
+    for line in lines:
+        for i in range(start_withdrawals + 10, len(line)):
+            if line[i] != " " and line[i - 1] == " " and line[i - 2] == " ":
+                start_deposits = min(start_deposits, i)
+                break
+    starts = [start_withdrawals, start_deposits]
+    for _ in range(2):
+        start = 10000
+        for line in lines:
+            for i in range(starts[-1] + 10, len(line)):
+                if line[i] != " ":
+                    start = min(start, i)
+                    break
+        starts.append(start)
+    return tuple(starts)
+
+
+def _statement_lines(seed):
+    random = np.random.default_rng(seed)
+    lines = []
+    for _ in range(random.integers(0, 15)):
+        description = random.choice(["PAIEMENT CARTE", "Café ÉPICERIE", "VIR", ""])
+        amounts = [
+            (
+                f"{random.integers(0, 10**6) / 100:,.2f}".replace(",", " ")
+                if random.random() < 0.6
+                else ""
+            )
+            for _ in range(2)
+        ]
+        date = random.choice(["03JUN", "30JUL", "15D¯C", ""])
+        balance = f"{random.integers(-(10**6), 10**6) / 100:.2f}"
+        widths = random.integers(1, 8, size=4)
+        line = (
+            f"{description:<40}"
+            + " " * widths[0]
+            + f"{amounts[0]:>12}"
+            + " " * widths[1]
+            + f"{amounts[1]:>12}"
+            + " " * widths[2]
+            + date
+            + " " * widths[3]
+            + (balance if random.random() < 0.5 else "")
+        )
+        lines.append(line.rstrip() if random.random() < 0.5 else line)
+    return lines
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_column_starts(seed):
+    lines = _statement_lines(seed)
+    assert _column_starts(lines) == _column_starts_by_loop(lines)